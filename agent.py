@@ -184,12 +184,12 @@ def reoptimize_remaining_route(session_id: str):
         if result.get("status") == "success":
             new_sequence = result["optimized_route"]
             new_active_route = [s for s in state["active_route"] if s["status"] == "completed"]
+            remaining_by_name = {}
+            for s in remaining_stops:
+                remaining_by_name.setdefault(s["name"].lower(), s)
             
             for city_name in new_sequence[1:]:  # Skip first (current location)
-                matching_stop = next(
-                    (s for s in remaining_stops if s["name"].lower() == city_name.lower()),
-                    None
-                )
+                matching_stop = remaining_by_name.get(city_name.lower())
                 if matching_stop:
                     new_active_route.append(matching_stop)
             
@@ -1,6 +1,7 @@
 import os
-from datetime import datetime, timedelta
-from supabase import create_client, Client
+from typing import Optional
+from datetime import datetime
+from supabase import create_client, acreate_client, Client, AsyncClient
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,50 +9,52 @@ url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 supabase: Client = create_client(url, key)
 
-def get_session_state(session_id: str):
-    """Fetches the active route for a specific session."""
-    response = supabase.table("active_routes") \
-        .select("*") \
+_async_supabase: Optional[AsyncClient] = None
+
+async def get_async_supabase() -> AsyncClient:
+    """Lazily creates the async client (acreate_client must run inside the event loop)."""
+    global _async_supabase
+    if _async_supabase is None:
+        _async_supabase = await acreate_client(url, key)
+    return _async_supabase
+
+def _session_state_query(client, session_id: str):
+    return client.table("active_routes") \
+        .select("*, stops(*)") \
         .eq("session_id", session_id) \
         .eq("status", "active") \
         .order("created_at", desc=True) \
-        .limit(1) \
-        .execute()
-    
+        .limit(1)
+
+def _to_session_state(response):
     if not response.data:
         return {"is_active": False, "active_route": []}
     
     route_data = response.data[0]
-    route_id = route_data["id"]
-    
-    stops_response = supabase.table("stops") \
-        .select("*") \
-        .eq("route_id", route_id) \
-        .order("visit_sequence") \
-        .execute()
+    stops = sorted(route_data.get("stops") or [], key=lambda s: s.get("visit_sequence") or 0)
         
     return {
         "is_active": True,
-        "route_id": route_id,
+        "route_id": route_data["id"],
         "driver_name": route_data.get("driver_name"),
-        "active_route": stops_response.data,
+        "active_route": stops,
         "last_updated": route_data.get("last_updated")
     }
 
+def get_session_state(session_id: str):
+    """Fetches the active route for a specific session, with its stops embedded."""
+    return _to_session_state(_session_state_query(supabase, session_id).execute())
+
+async def get_session_state_async(session_id: str):
+    """Async variant of get_session_state for handlers running on the event loop."""
+    client = await get_async_supabase()
+    return _to_session_state(await _session_state_query(client, session_id).execute())
+
 def create_new_route_db(session_id: str, driver_name: str, stops_data: list, status: str = "draft"):
-    """Creates a new route in the DB."""
-    route_res = supabase.table("active_routes").insert({
-        "session_id": session_id,
-        "driver_name": driver_name,
-        "status": status,
-        "last_updated": datetime.now().isoformat()
-    }).execute()
-    route_id = route_res.data[0]["id"]
-    
+    """Creates a new route and its stops in the DB in one transactional call."""
     formatted_stops = []
     for stop in stops_data:
         formatted_stops.append({
-            "route_id": route_id,
             "name": stop["name"],
             "lat": stop["lat"],
             "lon": stop["lon"],
@@ -60,8 +63,13 @@ def create_new_route_db(session_id: str, driver_name: str, stops_data: list, sta
             "eta": stop.get("eta")
         })
         
-    supabase.table("stops").insert(formatted_stops).execute()
-    return route_id
+    response = supabase.rpc("create_route_with_stops", {
+        "p_session": session_id,
+        "p_driver": driver_name,
+        "p_status": status,
+        "p_stops": formatted_stops
+    }).execute()
+    return response.data
 
 def mark_stop_complete_db(stop_id: int):
     """Updates stop status to completed"""
@@ -87,26 +95,12 @@ def activate_route_db(route_id: int, driver_name: str):
 
 def update_etas_db(route_id: int, delay_minutes: int):
     """
-    Fetches pending stops for a route and adds the delay to their existing ETAs.
+    Adds the delay to the ETAs of all pending stops on a route.
+    Runs server-side as one statement (see apply_delay_to_route migration).
     """
-    response = supabase.table("stops") \
-        .select("*") \
-        .eq("route_id", route_id) \
-        .eq("status", "pending") \
-        .execute()
-    
-    updated_count = 0
-    for stop in response.data:
-        if stop.get("eta"):
-            try:
-                current_eta = datetime.fromisoformat(stop["eta"])
-                new_eta = current_eta + timedelta(minutes=delay_minutes)                
-                supabase.table("stops").update({
-                    "eta": new_eta.isoformat()
-                }).eq("id", stop["id"]).execute()
-                
-                updated_count += 1
-            except ValueError:
-                continue 
+    response = supabase.rpc("apply_delay_to_route", {
+        "p_route_id": route_id,
+        "p_delay": delay_minutes
+    }).execute()
 
-    return updated_count
\ No newline at end of file
+    return response.data or 0
@@ -1,19 +1,24 @@
 import os
 import json
-import requests
+import asyncio
+import hashlib
+import httpx
+from uuid import uuid4
+from threading import Lock
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from cachetools import LRUCache, TTLCache
 import google.generativeai as genai
 
 from route import solve_route
 from traffic import generate_traffic_map
 from agent import run_logistics_chat
-from db import get_session_state, create_new_route_db, activate_route_db
+from db import get_session_state_async, create_new_route_db, activate_route_db
 
 load_dotenv()
 ORS_API_KEY = os.getenv("ORS_API_KEY")
@@ -23,6 +28,45 @@ TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-2.5-flash')
 
+# Intent parsing is schema-bound extraction, so it runs on the lighter model
+# and lets Gemini enforce the JSON shape.
+INTENT_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "location_name": {"type": "STRING"},
+            "visit_sequence": {"type": "INTEGER"}
+        },
+        "required": ["location_name", "visit_sequence"]
+    }
+}
+intent_model = genai.GenerativeModel(
+    'gemini-2.5-flash-lite',
+    generation_config={
+        "response_mime_type": "application/json",
+        "response_schema": INTENT_SCHEMA
+    }
+)
+
+# CACHES
+# Parsed intents are keyed by a hash of the normalized request text; geocodes by
+# lowercased place name. Only successful lookups are cached.
+INTENT_CACHE_TTL = 24 * 3600
+_intent_cache = TTLCache(maxsize=1024, ttl=INTENT_CACHE_TTL)
+_geocode_cache = LRUCache(maxsize=4096)
+_cache_lock = Lock()
+
+# Results of /optimize-route/async jobs, kept for an hour for polling.
+OPTIMIZE_JOB_TTL = 3600
+_optimize_jobs = TTLCache(maxsize=1024, ttl=OPTIMIZE_JOB_TTL)
+
+# Shared client so geocoding requests reuse keep-alive connections to ORS.
+ors_client = httpx.AsyncClient(
+    timeout=10,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+)
+
 app = FastAPI(
     title="AI Logistics Optimizer with Driver Copilot",
     description="Production-ready logistics optimization with AI agent",
@@ -75,22 +119,38 @@ class OptimizedRouteSummaryRequest(BaseModel):
     weather_alerts: Optional[List[str]] = []
     full_log: Optional[List[Dict[str, Any]]] = []
     
-def get_coords_from_ors(location_name: str):
+async def get_coords_from_ors(location_name: str, client: httpx.AsyncClient):
     """Geocode location using OpenRouteService"""
+    key = location_name.strip().lower()
+    with _cache_lock:
+        cached = _geocode_cache.get(key)
+    if cached:
+        return cached
+
     try:
-        url = f"https://api.openrouteservice.org/geocode/search?api_key={ORS_API_KEY}&text={location_name}"
-        r = requests.get(url, timeout=10)
+        url = "https://api.openrouteservice.org/geocode/search"
+        r = await client.get(url, params={"api_key": ORS_API_KEY, "text": location_name})
         if r.status_code == 200:
             data = r.json()
             if data['features']:
                 coords = data['features'][0]['geometry']['coordinates']
-                return coords[1], coords[0]  # lat, lon
+                result = (coords[1], coords[0])  # lat, lon
+                with _cache_lock:
+                    _geocode_cache[key] = result
+                return result
     except Exception as e:
         print(f"Geocoding error: {e}")
     return None, None
 
 def parse_logistics_intent(text: str):
     """Extract locations and sequence from natural language"""
+    normalized = " ".join(text.lower().split())
+    key = "intent:" + hashlib.sha1(normalized.encode()).hexdigest()
+    with _cache_lock:
+        cached = _intent_cache.get(key)
+    if cached:
+        return cached
+
     prompt = f"""
     You are a Logistics Dispatcher. Analyze this request: "{text}"
     
@@ -103,17 +163,18 @@ def parse_logistics_intent(text: str):
          * If the user says "then", "after", "first", "second": Assign increasing sequence numbers (2, 3, 4...).
          * If the user just lists cities ("visit A, B, and C"): Assign the SAME sequence number to all of them (e.g., all are 2).
     
-    Return a raw JSON array. Each object must have:
+    Return a JSON array. Each object must have:
     - "location_name": str
     - "visit_sequence": int (1-based index)
-    
-    Do not use markdown. Return only JSON.
     """
     
     try:
-        response = model.generate_content(prompt)
-        clean_text = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(clean_text)
+        response = intent_model.generate_content(prompt)
+        result = json.loads(response.text)
+        if result:
+            with _cache_lock:
+                _intent_cache[key] = result
+        return result
     except Exception as e:
         print(f"LLM Parsing failed: {e}")
         return []
@@ -121,15 +182,17 @@ def parse_logistics_intent(text: str):
 @app.post("/extract-sequence", response_model=RouteResponse)
 async def extract_sequence(query: LogisticsQuery):
     """Extract locations and sequence from natural language query"""
-    extracted_data = parse_logistics_intent(query.request_text)
+    extracted_data = await asyncio.to_thread(parse_logistics_intent, query.request_text)
     if not extracted_data:
         raise HTTPException(status_code=400, detail="No locations found in text.")
 
     final_locations = []
+    coords = await asyncio.gather(*[
+        get_coords_from_ors(item["location_name"], ors_client)
+        for item in extracted_data
+    ])
     
-    for item in extracted_data:
-        lat, lon = get_coords_from_ors(item["location_name"])
-        
+    for item, (lat, lon) in zip(extracted_data, coords):
         if lat and lon:
             final_locations.append(LocationPoint(
                 name=item["location_name"],
@@ -141,8 +204,40 @@ async def extract_sequence(query: LogisticsQuery):
     final_locations.sort(key=lambda x: x.visit_sequence)
     return RouteResponse(parsed_locations=final_locations)
 
+def build_route_summary_prompt(data: OptimizedRouteSummaryRequest) -> str:
+    """Gemini prompt for the driver-facing route summary."""
+    route_text = " → ".join([loc.name for loc in data.optimized_route])
+    total_stops = len(data.optimized_route)
+    weather_text = ""
+    if data.weather_alerts:
+        weather_text = "Weather alerts: " + ", ".join(data.weather_alerts)
+
+    time_violations = []
+    for entry in data.full_log or []:
+        if entry.get("event") == "Wait" and entry.get("reason"):
+            time_violations.append(f"{entry.get('name', 'Unknown')}: {entry['reason']}")
+    time_violation_text = ""
+    if time_violations:
+        time_violation_text = "Time delays due to: " + "; ".join(time_violations)
+
+    return f"""
+    You are an AI Logistics Assistant. Summarize the following delivery route for the driver:
+
+    Route: {route_text}
+    Total stops: {total_stops}
+    Total distance: {data.total_distance_km} km
+    Total duration: {data.total_duration_hours} hours
+
+    {weather_text}
+    {time_violation_text}
+
+    Generate a clear, concise summary with driving advice, sequence of stops, and any important notes and also keep in mind the weather conditions given to you.
+    Warn the driver according to the details of the wether conditions about the source cities.
+    Return plain text, no JSON or markdown.
+    """
+
 @app.post("/route/summary")
-async def route_summary(data: OptimizedRouteSummaryRequest):
+def route_summary(data: OptimizedRouteSummaryRequest):
     """
     Summarize an optimized route using Gemini AI.
     Includes weather/time violations for better driver advice.
@@ -151,36 +246,7 @@ async def route_summary(data: OptimizedRouteSummaryRequest):
         if not data.optimized_route or len(data.optimized_route) < 2:
             raise HTTPException(status_code=400, detail="At least two locations required for summary.")
 
-        route_text = " → ".join([loc.name for loc in data.optimized_route])
-        total_stops = len(data.optimized_route)
-        weather_text = ""
-        if data.weather_alerts:
-            weather_text = "Weather alerts: " + ", ".join(data.weather_alerts)
-
-        time_violations = []
-        for entry in data.full_log or []:
-            if entry.get("event") == "Wait" and entry.get("reason"):
-                time_violations.append(f"{entry.get('name', 'Unknown')}: {entry['reason']}")
-        time_violation_text = ""
-        if time_violations:
-            time_violation_text = "Time delays due to: " + "; ".join(time_violations)
-
-        prompt = f"""
-        You are an AI Logistics Assistant. Summarize the following delivery route for the driver:
-
-        Route: {route_text}
-        Total stops: {total_stops}
-        Total distance: {data.total_distance_km} km
-        Total duration: {data.total_duration_hours} hours
-
-        {weather_text}
-        {time_violation_text}
-
-        Generate a clear, concise summary with driving advice, sequence of stops, and any important notes and also keep in mind the weather conditions given to you.
-        Warn the driver according to the details of the wether conditions about the source cities.
-        Return plain text, no JSON or markdown.
-        """
-        response = model.generate_content(prompt)
+        response = model.generate_content(build_route_summary_prompt(data))
         summary_text = response.text.strip()
         return {
             "status": "success",
@@ -191,9 +257,89 @@ async def route_summary(data: OptimizedRouteSummaryRequest):
         print(f"[route/summary ERROR] {e}")
         raise HTTPException(status_code=500, detail=f"Route summary generation failed: {str(e)}")
 
+@app.post("/route/summary/stream")
+def route_summary_stream(data: OptimizedRouteSummaryRequest):
+    """Same summary as /route/summary, streamed as plain text while Gemini generates it."""
+    if not data.optimized_route or len(data.optimized_route) < 2:
+        raise HTTPException(status_code=400, detail="At least two locations required for summary.")
+
+    try:
+        response = model.generate_content(build_route_summary_prompt(data), stream=True)
+    except Exception as e:
+        print(f"[route/summary/stream ERROR] {e}")
+        raise HTTPException(status_code=500, detail=f"Route summary generation failed: {str(e)}")
+
+    def chunks():
+        try:
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            print(f"[route/summary/stream ERROR] {e}")
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+def optimize_and_save_route(locations_list: List[Dict[str, Any]], session_id: str):
+    """Run the GA on the given stops and save the result as a draft route."""
+    result = solve_route(locations_list)
+    
+    if result.get("status") == "error":
+        raise HTTPException(status_code=500, detail=result.get("message"))
+    
+    if "full_log" in result:
+        for entry in result["full_log"]:
+            if "time" in entry and isinstance(entry["time"], datetime):
+                entry["time"] = entry["time"].isoformat()
+    
+    optimized_stops_data = []
+    stop_events = [
+        event for event in result["full_log"] 
+        if event["event"] in ["Depart", "Arrive"]
+    ]
+    route_names = result["optimized_route"]
+    
+    if len(stop_events) != len(route_names):
+        print(f"Warning: Log length {len(stop_events)} != Route length {len(route_names)}")
+    
+    loc_by_name = {}
+    for loc in locations_list:
+        loc_by_name.setdefault(loc["name"], loc)
+    
+    for i, name in enumerate(route_names):
+        original = loc_by_name.get(name)
+        eta_iso = None
+        if i < len(stop_events):
+            raw_time = stop_events[i]["time"]
+            if isinstance(raw_time, datetime):
+                eta_iso = raw_time.isoformat()
+            else:
+                eta_iso = raw_time
+                
+        if original:
+            optimized_stops_data.append({
+                "name": name,
+                "lat": original["lat"],
+                "lon": original["lon"],
+                "visit_sequence": i + 1,
+                "status": "completed" if i == 0 else "pending",
+                "eta": eta_iso
+            })
+
+    route_id = create_new_route_db(
+        session_id=session_id,
+        driver_name="Driver_001",
+        stops_data=optimized_stops_data,
+        status="draft"
+    )
+
+    return {
+        **result, 
+        "route_id": route_id, 
+        "message": "Route optimized and saved as draft."
+    }
 
 @app.post("/optimize-route")
-async def optimize_route(data: RouteResponse, session_id: str = Query(..., description="Bind optimization to session")):
+def optimize_route(data: RouteResponse, session_id: str = Query(..., description="Bind optimization to session")):
     """Optimize route using genetic algorithm with weather awareness"""
     try:
         if not data.parsed_locations:
@@ -203,64 +349,55 @@ async def optimize_route(data: RouteResponse, session_id: str = Query(..., descr
             )
 
         locations_list = [loc.dict() for loc in data.parsed_locations]
-        result = solve_route(locations_list)
-        
-        if result.get("status") == "error":
-            raise HTTPException(status_code=500, detail=result.get("message"))
-        
-        if "full_log" in result:
-            for entry in result["full_log"]:
-                if "time" in entry and isinstance(entry["time"], datetime):
-                    entry["time"] = entry["time"].isoformat()
-        
-        optimized_stops_data = []
-        stop_events = [
-            event for event in result["full_log"] 
-            if event["event"] in ["Depart", "Arrive"]
-        ]
-        route_names = result["optimized_route"]
-        
-        if len(stop_events) != len(route_names):
-            print(f"Warning: Log length {len(stop_events)} != Route length {len(route_names)}")
-        
-        for i, name in enumerate(route_names):
-            original = next((loc for loc in locations_list if loc["name"] == name), None)
-            eta_iso = None
-            if i < len(stop_events):
-                raw_time = stop_events[i]["time"]
-                if isinstance(raw_time, datetime):
-                    eta_iso = raw_time.isoformat()
-                else:
-                    eta_iso = raw_time
-                    
-            if original:
-                optimized_stops_data.append({
-                    "name": name,
-                    "lat": original["lat"],
-                    "lon": original["lon"],
-                    "visit_sequence": i + 1,
-                    "status": "completed" if i == 0 else "pending",
-                    "eta": eta_iso
-                })
-
-        route_id = create_new_route_db(
-            session_id=session_id,
-            driver_name="Driver_001",
-            stops_data=optimized_stops_data,
-            status="draft"
-        )
-
-        return {
-            **result, 
-            "route_id": route_id, 
-            "message": "Route optimized and saved as draft."
-        }
+        return optimize_and_save_route(locations_list, session_id)
     except Exception as e:
         print(f"[optimize-route ERROR] {e}")
         raise HTTPException(status_code=500, detail=f"Optimize route failed: {str(e)}")
 
+def _run_optimize_job(task_id: str, locations_list: List[Dict[str, Any]], session_id: str):
+    try:
+        job = {"status": "success", "result": optimize_and_save_route(locations_list, session_id)}
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"[optimize-route/async ERROR] {detail}")
+        job = {"status": "error", "message": f"Optimize route failed: {detail}"}
+    with _cache_lock:
+        _optimize_jobs[task_id] = job
+
+@app.post("/optimize-route/async", status_code=202)
+def optimize_route_async(
+    data: RouteResponse,
+    background_tasks: BackgroundTasks,
+    session_id: str = Query(..., description="Bind optimization to session")
+):
+    """
+    Queue route optimization and return a task_id immediately.
+    Poll /optimize-route/status/{task_id} for the result.
+    """
+    if not data.parsed_locations:
+        raise HTTPException(
+            status_code=400,
+            detail="No locations provided for route optimization"
+        )
+
+    task_id = uuid4().hex
+    with _cache_lock:
+        _optimize_jobs[task_id] = {"status": "pending"}
+    locations_list = [loc.dict() for loc in data.parsed_locations]
+    background_tasks.add_task(_run_optimize_job, task_id, locations_list, session_id)
+    return {"task_id": task_id, "status": "pending"}
+
+@app.get("/optimize-route/status/{task_id}")
+def optimize_route_status(task_id: str):
+    """Status of a queued optimization; includes the full result once finished."""
+    with _cache_lock:
+        job = _optimize_jobs.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired task_id")
+    return {"task_id": task_id, **job}
+
 @app.post("/create-manifest")
-async def create_manifest(manifest: RouteManifest):
+def create_manifest(manifest: RouteManifest):
     """Create a new delivery manifest and initialize the agent state"""
     try:
         result = activate_route_db(manifest.route_id, manifest.driver_name)
@@ -285,7 +422,7 @@ async def create_manifest(manifest: RouteManifest):
 
 # AI AGENT ENDPOINTS
 @app.post("/agent/chat")
-async def agent_chat(message: ChatMessage):
+def agent_chat(message: ChatMessage):
     """
     Chat with AI logistics copilot
     
@@ -313,7 +450,7 @@ async def agent_chat(message: ChatMessage):
 @app.get("/agent/status")
 async def get_agent_status(session_id: str = Query(..., description="Session ID to fetch status for")):
     """Get current route status from agent state"""
-    state = get_session_state(session_id)
+    state = await get_session_state_async(session_id)
     if not state["is_active"]:
         return {"status": "no_active_route", "active": False}
     
@@ -354,6 +491,10 @@ async def view_traffic_map(filename: str):
     
     return FileResponse(file_path, media_type="text/html")
   
+@app.on_event("shutdown")
+async def close_http_clients():
+    await ors_client.aclose()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
\ No newline at end of file
@@ -1,8 +1,17 @@
 import os
+import time
+import hashlib
+import tempfile
 import requests
-import random
+import numpy as np
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from threading import Lock
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 load_dotenv()
@@ -16,25 +25,119 @@ MUTATION_RATE = 0.20
 ALPHA = 1.0
 BETA = 1.5
 SEQUENCE_PENALTY = 1000000
+CONVERGENCE_PATIENCE = 20
+CONVERGENCE_EPSILON = 1e-6
+CONVERGENCE_REL_TOL = 1e-4
+MEMO_HIT_WINDOW = 500
+MEMO_HIT_RATE_STOP = 0.95
+MEMO_MAX_ENTRIES = 4096
+EXACT_SOLVER_MAX_STOPS = 12
+LOCAL_SEARCH_MAX_STOPS = 20
+
+# HTTP SESSIONS
+# Keep-alive pools so repeated matrix/forecast calls reuse TLS connections.
+def _pooled_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    )
+    session.mount("https://", adapter)
+    return session
+
+ORS_SESSION = _pooled_session()
+ORS_SESSION.headers.update({"Authorization": ORS_API or ""})
+WEATHER_SESSION = _pooled_session()
 
 # DISTANCE MATRIX
-def get_distance_matrix(locations):
-    coords = [[loc['lon'], loc['lat']] for loc in locations]
+# Matrices are cached per stop set, stored in sorted coordinate order so the
+# same stops submitted in a different order still hit.
+MATRIX_CACHE_TTL = 900
+_matrix_cache = TTLCache(maxsize=64, ttl=MATRIX_CACHE_TTL)
+_matrix_lock = Lock()
+
+# Second tier on disk so restarts and other workers reuse matrices. ORS
+# driving-car matrices do not follow live traffic, so entries keep for days.
+MATRIX_DISK_CACHE_DIR = os.getenv("ORS_MATRIX_CACHE_DIR", ".cache/ors_matrix")
+MATRIX_DISK_CACHE_TTL = 7 * 24 * 3600
+
+def _matrix_disk_path(key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(MATRIX_DISK_CACHE_DIR, f"{digest}.npz")
+
+def _load_matrix_from_disk(key):
+    path = _matrix_disk_path(key)
+    try:
+        if time.time() - os.path.getmtime(path) > MATRIX_DISK_CACHE_TTL:
+            return None
+        with np.load(path) as data:
+            return data["distances"], data["durations"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _save_matrix_to_disk(key, matrices):
+    try:
+        os.makedirs(MATRIX_DISK_CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=MATRIX_DISK_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, distances=matrices[0], durations=matrices[1])
+        os.replace(tmp, _matrix_disk_path(key))
+    except OSError as e:
+        print(f"[route.py] Matrix cache write failed: {e}")
+
+def _fetch_distance_matrix(coords):
     url = "https://api.openrouteservice.org/v2/matrix/driving-car"
-    headers = {"Authorization": ORS_API, "Content-Type": "application/json"}
     body = {"locations": coords, "metrics": ["distance", "duration"]}
 
     try:
-        r = requests.post(url, json=body, headers=headers, timeout=15)
+        r = ORS_SESSION.post(url, json=body, timeout=15)
         r.raise_for_status()
         data = r.json()
-        return data["distances"], data["durations"]
+        return (
+            np.asarray(data["distances"], dtype=np.float64),
+            np.asarray(data["durations"], dtype=np.float64)
+        )
     except Exception as e:
         print(f"[route.py] Matrix API Error: {e}")
-        return [], []
+        return None, None
+
+def get_distance_matrix(locations):
+    """(distances, durations) as float64 ndarrays in the order of locations, or (None, None)."""
+    coords = [[round(loc['lon'], 4), round(loc['lat'], 4)] for loc in locations]
+    order = sorted(range(len(coords)), key=coords.__getitem__)
+    key = tuple(tuple(coords[i]) for i in order)
+
+    with _matrix_lock:
+        cached = _matrix_cache.get(key)
+    if cached is None:
+        cached = _load_matrix_from_disk(key)
+        if cached is None:
+            cached = _fetch_distance_matrix([coords[i] for i in order])
+            if cached[0] is None:
+                return None, None
+            _save_matrix_to_disk(key, cached)
+        with _matrix_lock:
+            _matrix_cache[key] = cached
+
+    pos = np.argsort(order)
+    distances, durations = cached
+    return distances[np.ix_(pos, pos)], durations[np.ix_(pos, pos)]
 
 # WEATHER FETCH (THREADED)
+# Forecasts are cached per location rounded to ~1 km, so re-optimizing the
+# same stops within the TTL does not refetch them.
+WEATHER_CACHE_TTL = 600
+_weather_cache = TTLCache(maxsize=1024, ttl=WEATHER_CACHE_TTL)
+_weather_lock = Lock()
+
 def _fetch_weather(idx, loc):
+    key = (round(loc["lat"], 2), round(loc["lon"], 2))
+    with _weather_lock:
+        cached = _weather_cache.get(key)
+    if cached is not None:
+        return idx, cached
+
     try:
         url = "https://api.openweathermap.org/data/2.5/forecast"
         params = {
@@ -43,10 +146,14 @@ def _fetch_weather(idx, loc):
             "appid": WEATHER_API,
             "units": "metric"
         }
-        r = requests.get(url, params=params, timeout=10).json()
+        r = WEATHER_SESSION.get(url, params=params, timeout=10).json()
         entries = r.get("list", [])
         for e in entries:
-            e["_dt"] = datetime.strptime(e["dt_txt"], "%Y-%m-%d %H:%M:%S")
+            e["_ts"] = float(e["dt"])
+        entries.sort(key=lambda e: e["_ts"])
+        if entries:
+            with _weather_lock:
+                _weather_cache[key] = entries
         return idx, entries
     except:
         return idx, []
@@ -61,25 +168,14 @@ def fetch_weather_forecasts(locations):
     return forecasts
 
 # WEATHER CHECK
-def check_weather_at_time(forecast_list, target_datetime):
-    if not forecast_list:
-        return False, 0, ""
-
-    best = None
-    min_diff = float("inf")
-
-    for e in forecast_list:
-        diff = abs((e["_dt"] - target_datetime).total_seconds())
-        if diff < min_diff:
-            min_diff = diff
-            best = e
+WEATHER_MATCH_WINDOW_SEC = 10800
+WEATHER_WAIT_SEC = 7200
+WEATHER_BUCKET_SEC = 1800
 
-    if not best or min_diff > 10800:
-        return False, 0, ""
-
-    rain = best.get("rain", {}).get("3h", 0) or 0
-    wind = best.get("wind", {}).get("speed", 0) or 0
-    vis = best.get("visibility", 10000) or 10000
+def assess_forecast_entry(entry):
+    rain = entry.get("rain", {}).get("3h", 0) or 0
+    wind = entry.get("wind", {}).get("speed", 0) or 0
+    vis = entry.get("visibility", 10000) or 10000
 
     reasons = []
     if rain > 5.0:
@@ -90,10 +186,114 @@ def check_weather_at_time(forecast_list, target_datetime):
         reasons.append(f"Fog/Low Visibility ({vis}m)")
 
     if reasons:
-        return True, 7200, ", ".join(reasons)
+        return True, WEATHER_WAIT_SEC, ", ".join(reasons)
 
     return False, 0, ""
 
+def nearest_forecast(entries, target_datetime):
+    """
+    Closest entry to target_datetime in a time-sorted forecast list and its
+    distance in seconds. Bisects, then compares only the two neighbours.
+    """
+    if not entries:
+        return None, float("inf")
+
+    target_ts = target_datetime.timestamp()
+    pos = bisect_left(entries, target_ts, key=lambda e: e["_ts"])
+    candidates = entries[max(pos - 1, 0):pos + 1]
+    diffs = [abs(e["_ts"] - target_ts) for e in candidates]
+    i = diffs.index(min(diffs))
+    return candidates[i], diffs[i]
+
+def check_weather_at_time(forecast_list, target_datetime):
+    best, min_diff = nearest_forecast(forecast_list, target_datetime)
+
+    if not best or min_diff > WEATHER_MATCH_WINDOW_SEC:
+        return False, 0, ""
+
+    return assess_forecast_entry(best)
+
+def build_weather_table(forecasts, n):
+    """
+    Pads per-stop forecasts into (n, k) arrays: entry timestamps (epoch
+    seconds, time-sorted, inf padding at the end) and the wait each entry
+    would impose.
+    """
+    k = max([len(forecasts.get(i, [])) for i in range(n)] + [1])
+    timestamps = np.full((n, k), np.inf)
+    waits = np.zeros((n, k))
+
+    for i in range(n):
+        for j, e in enumerate(forecasts.get(i, [])):
+            timestamps[i, j] = e["_ts"]
+            waits[i, j] = assess_forecast_entry(e)[1]
+
+    return timestamps, waits
+
+# Forecasts and their table for a whole stop set, so re-optimizing the same
+# stops skips both the fetch fan-out and the table build.
+_route_weather_cache = TTLCache(maxsize=256, ttl=WEATHER_CACHE_TTL)
+
+def get_route_weather(locations):
+    key = tuple((round(loc["lat"], 3), round(loc["lon"], 3)) for loc in locations)
+    with _weather_lock:
+        cached = _route_weather_cache.get(key)
+    if cached is not None:
+        return cached
+
+    forecasts = fetch_weather_forecasts(locations)
+    result = (forecasts, build_weather_table(forecasts, len(locations)))
+    if all(forecasts.values()):
+        with _weather_lock:
+            _route_weather_cache[key] = result
+    return result
+
+def nearest_forecast_waits(offsets, waits, stops, elapsed):
+    """
+    Vectorized check_weather_at_time: wait seconds for each (stop, elapsed)
+    pair. Rows are time-sorted, so only the entries either side of the
+    insertion point are compared.
+    """
+    k = offsets.shape[1]
+    pos = (offsets[stops] < elapsed[:, None]).sum(axis=1)
+    before = np.maximum(pos - 1, 0)
+    after = np.minimum(pos, k - 1)
+    d_before = np.abs(offsets[stops, before] - elapsed)
+    d_after = np.abs(offsets[stops, after] - elapsed)
+    nearest = np.where(d_before <= d_after, before, after)
+    diff = np.minimum(d_before, d_after)
+    return np.where(diff <= WEATHER_MATCH_WINDOW_SEC, waits[stops, nearest], 0.0)
+
+def build_wait_lookup(forecast_ts, forecast_waits, start_ts):
+    """
+    Wait seconds per (stop, arrival bucket) for one solve, as (lookup, phase).
+    Buckets are WEATHER_BUCKET_SEC wide and aligned to the epoch, so for
+    forecast entries on the half hour (OWM's are 3-hourly) every nearest-entry
+    and match-window boundary is a bucket edge and lookups agree with
+    nearest_forecast_waits. The extra last column covers arrivals past the
+    forecast horizon, where no entry is in range.
+    """
+    offsets = forecast_ts - start_ts
+    phase = start_ts % WEATHER_BUCKET_SEC
+    finite = offsets[np.isfinite(offsets)]
+    horizon = max(finite.max(), 0.0) + WEATHER_MATCH_WINDOW_SEC if finite.size else 0.0
+    buckets = int((horizon + phase) // WEATHER_BUCKET_SEC) + 1
+
+    n = len(offsets)
+    mids = np.arange(buckets) * WEATHER_BUCKET_SEC - phase + WEATHER_BUCKET_SEC / 2
+    stops = np.repeat(np.arange(n), buckets)
+    lookup = np.zeros((n, buckets + 1))
+    lookup[:, :-1] = nearest_forecast_waits(
+        offsets, forecast_waits, stops, np.tile(mids, n)
+    ).reshape(n, buckets)
+    return lookup, phase
+
+def weather_waits(weather_table, stops, elapsed):
+    """Wait seconds for each (stop, elapsed) pair, read from a build_wait_lookup table."""
+    lookup, phase = weather_table
+    bucket = ((elapsed + phase) // WEATHER_BUCKET_SEC).astype(np.intp)
+    return lookup[stops, np.minimum(bucket, lookup.shape[1] - 1)]
+
 def get_single_stop_weather(lat, lon, location_name, eta_iso=None):
     """
     Fetches fresh weather for a specific location and time.
@@ -107,21 +307,12 @@ def get_single_stop_weather(lat, lon, location_name, eta_iso=None):
     else:
         target_time = datetime.now()
 
-    if target_time.tzinfo is not None:
-        target_time = target_time.replace(tzinfo=None)
     _, entries = _fetch_weather(0, {"lat": lat, "lon": lon})
     
     if not entries:
         return f"Could not fetch weather data for {location_name}."
 
-    best_match = None
-    min_diff = float("inf")
-
-    for entry in entries:
-        diff = abs((entry["_dt"] - target_time).total_seconds())
-        if diff < min_diff:
-            min_diff = diff
-            best_match = entry
+    best_match, _ = nearest_forecast(entries, target_time)
 
     if best_match:
         desc = best_match.get("weather", [{}])[0].get("description", "Unknown").capitalize()
@@ -145,21 +336,16 @@ def get_single_stop_weather(lat, lon, location_name, eta_iso=None):
 
 # ROUTE METRICS
 def calculate_route_metrics(route, dist_matrix, dur_matrix, forecasts, start_time):
-    total_dist = 0
-    total_time = 0
+    route_arr = np.asarray(route)
+    legs = dur_matrix[route_arr[:-1], route_arr[1:]].tolist()
+    total_dist = float(dist_matrix[route_arr[:-1], route_arr[1:]].sum())
+    total_time = sum(legs)
     current_time = start_time
     travel_log = []
 
     travel_log.append({"city_idx": route[0], "event": "Depart", "time": current_time, "note": "Trip Start"})
 
-    for i in range(len(route) - 1):
-        u, v = route[i], route[i + 1]
-
-        d = dist_matrix[u][v]
-        t = dur_matrix[u][v]
-
-        total_dist += d
-        total_time += t
+    for v, t in zip(route[1:], legs):
         current_time += timedelta(seconds=t)
 
         wait, wsec, reason = check_weather_at_time(forecasts.get(v, []), current_time)
@@ -178,90 +364,310 @@ def calculate_route_metrics(route, dist_matrix, dur_matrix, forecasts, start_tim
 
     return total_dist, total_time, travel_log
 
-# SEQUENCE CHECK
-def check_sequence_violations(route, constraints):
-    seq = {i: c.get("visit_sequence", 2) for i, c in enumerate(constraints)}
-    violations = 0
-    for i in range(len(route)):
-        for j in range(i + 1, len(route)):
-            if seq[route[i]] > seq[route[j]]:
-                violations += 1
-    return violations
+# POPULATION COST (VECTORIZED)
+def population_travel_times(pop, dur, weather_table):
+    legs = dur[pop[:, :-1], pop[:, 1:]]
+    elapsed = np.zeros(len(pop))
 
-# COST CACHE
-cost_cache = {}
-def cost_function(route, dist_matrix, dur_matrix, forecasts, constraints, start_time):
-    key = tuple(route)
-    if key in cost_cache:
-        return cost_cache[key]
+    for j in range(legs.shape[1]):
+        elapsed += legs[:, j]
+        elapsed += weather_waits(weather_table, pop[:, j + 1], elapsed)
 
-    dist, t, _ = calculate_route_metrics(route, dist_matrix, dur_matrix, forecasts, start_time)
-    violations = check_sequence_violations(route, constraints)
+    return elapsed
 
-    cost = (ALPHA * dist) + (BETA * t) + (violations * SEQUENCE_PENALTY)
-    cost_cache[key] = cost
-    return cost
+def population_sequence_violations(pop, seq):
+    """
+    Pairs of stops visited against their visit_sequence order, per route.
+    Counted per distinct priority value (a running count of higher priorities
+    seen so far), so cost is O(k * n) for k distinct values instead of O(n^2).
+    """
+    s = seq[pop]
+    violations = np.zeros(len(pop), dtype=np.int64)
+    for value in np.unique(seq)[:-1]:
+        higher_seen = np.cumsum(s > value, axis=1)
+        violations += (higher_seen * (s == value)).sum(axis=1)
+    return violations
 
-def create_initial_population(n, src=0):
-    base = list(range(n))
-    base.remove(src)
-    return [[src] + random.sample(base, len(base)) for _ in range(POPULATION_SIZE)]
-
-def tournament_selection(pop, *args):
-    cand = random.sample(pop, 3)
-    cand.sort(key=lambda r: cost_function(r, *args))
-    return cand[0]
-
-def crossover(p1, p2):
-    a, b = sorted(random.sample(range(1, len(p1)), 2))
-    child = [None] * len(p1)
-    child[0] = p1[0]
-    child[a:b] = p1[a:b]
-    fill = [x for x in p2 if x not in child]
-    idx = 1
-    for x in fill:
-        while child[idx] is not None:
-            idx += 1
-        child[idx] = x
-    return child
-
-def mutate(route):
-    if random.random() < MUTATION_RATE:
-        a, b = random.sample(range(1, len(route)), 2)
-        route[a], route[b] = route[b], route[a]
+def population_costs(pop, dist, dur, seq, weather_table):
+    """Cost of every route in a (POP, n) population in one pass."""
+    total_dist = dist[pop[:, :-1], pop[:, 1:]].sum(axis=1)
+    total_time = population_travel_times(pop, dur, weather_table)
+    violations = population_sequence_violations(pop, seq)
+    return (ALPHA * total_dist) + (BETA * total_time) + (violations * SEQUENCE_PENALTY)
+
+def memoized_population_costs(pop, memo, dist, dur, seq, weather_table):
+    """
+    population_costs that only scores routes not already in memo (an
+    OrderedDict keyed by route bytes, kept to MEMO_MAX_ENTRIES in LRU order).
+    Returns the costs and how many rows had to be scored.
+    """
+    keys = [row.tobytes() for row in pop]
+    costs = np.empty(len(pop))
+    missing = []
+    for i, key in enumerate(keys):
+        cached = memo.get(key)
+        if cached is None:
+            missing.append(i)
+        else:
+            memo.move_to_end(key)
+            costs[i] = cached
+
+    if missing:
+        costs[missing] = population_costs(pop[missing], dist, dur, seq, weather_table)
+        for i in missing:
+            memo[keys[i]] = costs[i]
+
+    while len(memo) > MEMO_MAX_ENTRIES:
+        memo.popitem(last=False)
+    return costs, len(missing)
+
+# EXACT SOLVER (SMALL N)
+def held_karp(dist, dur, seq, weather_table, src=0):
+    """
+    Bitmask DP over (visited set, last stop). Each label carries its own
+    elapsed time, so weather waits are charged at that label's arrival time.
+    Optimal for the distance/time/sequence cost; with weather waits it keeps
+    the cheapest label per state.
+
+    Masks with the same number of visited stops only extend into the next
+    layer, and each (mask | v, v) state has a single source mask, so a whole
+    layer is relaxed in one (masks, last, next) batch.
+    """
+    n = len(dist)
+    size = 1 << n
+    cost = np.full((size, n), np.inf)
+    elapsed = np.zeros((size, n))
+    parent = np.full((size, n), -1)
+    cost[1 << src, src] = 0.0
+    bit_values = 1 << np.arange(n)
+
+    masks = np.arange(size)
+    members = (masks[:, None] & bit_values) != 0
+    visited = members.sum(axis=1)
+    out_of_order = (seq[:, None] > seq[None, :]).astype(np.int64)
+    stops = np.arange(n)
+
+    for count in range(1, n):
+        layer = masks[(visited == count) & members[:, src]]
+        in_mask = members[layer]
+
+        arrival = elapsed[layer][:, :, None] + dur
+        waits = weather_waits(
+            weather_table, np.broadcast_to(stops, arrival.shape).ravel(), arrival.ravel()
+        ).reshape(arrival.shape)
+        violations = in_mask.astype(np.int64) @ out_of_order
+        step = (ALPHA * dist) + (BETA * (dur + waits)) + (violations[:, None, :] * SEQUENCE_PENALTY)
+        total = cost[layer][:, :, None] + step
+        total[np.broadcast_to(in_mask[:, None, :], total.shape)] = np.inf
+
+        pick = total.argmin(axis=1)
+        best = np.take_along_axis(total, pick[:, None, :], axis=1)[:, 0]
+        r, v = np.nonzero(np.isfinite(best))
+        new_masks, p = layer[r] | bit_values[v], pick[r, v]
+        cost[new_masks, v] = best[r, v]
+        elapsed[new_masks, v] = arrival[r, p, v] + waits[r, p, v]
+        parent[new_masks, v] = p
+
+    mask = size - 1
+    j = int(cost[mask].argmin())
+    route = []
+    while j != -1:
+        route.append(j)
+        mask, j = mask ^ (1 << j), int(parent[mask, j])
+    return route[::-1]
+
+# LOCAL SEARCH (MEDIUM N)
+def nearest_neighbor_route(dist, dur, seq, src=0):
+    """Greedy seed: always step to the cheapest stop among the lowest visit_sequence left."""
+    edge = (ALPHA * dist) + (BETA * dur)
+    remaining = np.ones(len(dist), dtype=bool)
+    remaining[src] = False
+    route = [src]
+    while remaining.any():
+        lowest = seq[remaining].min()
+        step = np.where(remaining & (seq == lowest), edge[route[-1]], np.inf)
+        v = int(step.argmin())
+        route.append(v)
+        remaining[v] = False
     return route
 
-def solve_route(locations_data):
-    if len(locations_data) < 2:
-        return {"status": "error", "message": "Need at least 2 locations."}
+def two_opt(route, dist, dur, seq, weather_table):
+    """
+    Best-improvement 2-opt. Every segment reversal of the current route is
+    scored in one population_costs call, so sequence and weather stay exact.
+    """
+    n = len(route)
+    moves = []
+    for i in range(1, n - 1):
+        for k in range(i + 1, n):
+            idx = np.arange(n)
+            idx[i:k + 1] = idx[i:k + 1][::-1]
+            moves.append(idx)
+    moves = np.array(moves)
+
+    route = np.asarray(route)
+    current = population_costs(route[None, :], dist, dur, seq, weather_table)[0]
+    while True:
+        candidates = route[moves]
+        costs = population_costs(candidates, dist, dur, seq, weather_table)
+        b = costs.argmin()
+        if costs[b] >= current - CONVERGENCE_EPSILON:
+            return route.tolist()
+        route, current = candidates[b], costs[b]
+
+# GENETIC ALGORITHM (LARGE N)
+def create_initial_population(n, src=0):
+    base = np.array([i for i in range(n) if i != src])
+    perms = np.argsort(np.random.random((POPULATION_SIZE, n - 1)), axis=1)
+    return np.hstack([np.full((POPULATION_SIZE, 1), src), base[perms]])
 
-    dist_matrix, dur_matrix = get_distance_matrix(locations_data)
-    if not dist_matrix:
-        return {"status": "error", "message": "Failed to fetch Matrix API."}
+def tournament_selection(costs, count, k=3):
+    """Indices of `count` tournament winners, each the cheapest of k random picks."""
+    cand = np.random.randint(0, len(costs), (count, k))
+    return cand[np.arange(count), costs[cand].argmin(axis=1)]
 
-    forecasts = fetch_weather_forecasts(locations_data)
-    start_time = datetime.now()
-    population = create_initial_population(len(locations_data))
+def crossover(p1, p2, out):
+    """
+    Order crossover for a whole batch of parent rows at once, written into
+    out (which must not alias a parent). Each child keeps the source and a
+    random segment of p1; the free slots take the remaining cities in p2 order.
+    """
+    m, n = p1.shape
+    rows = np.arange(m)[:, None]
+    cols = np.arange(n)
+
+    a = np.random.randint(1, n, m)
+    b = 1 + (a - 1 + np.random.randint(1, n - 1, m)) % (n - 1)
+    lo, hi = np.minimum(a, b)[:, None], np.maximum(a, b)[:, None]
+    keep = (cols == 0) | ((cols >= lo) & (cols < hi))
+
+    present = np.zeros((m, n), dtype=bool)
+    r, c = np.nonzero(keep)
+    present[r, p1[r, c]] = True
+
+    out[keep] = p1[keep]
+    out[~keep] = p2[~present[rows, p2]]
+    return out
+
+def mutate(pop, edge):
+    """
+    Mutates a MUTATION_RATE share of rows in place. Each tries one random
+    2-opt segment reversal, kept only if it lowers the path's weighted edge
+    cost; rows where it would not fall back to swapping two genes so the
+    population keeps exploring. The delta covers the two boundary edges and
+    the reversed segment's own legs (the matrices are asymmetric); sequence
+    and weather are left to the next generation's full cost.
+    """
+    rows = np.flatnonzero(np.random.random(len(pop)) < MUTATION_RATE)
+    if len(rows) == 0:
+        return pop
+
+    sub = pop[rows]
+    m, n = sub.shape
+    r = np.arange(m)
+    i = np.random.randint(1, n - 1, m)
+    k = np.random.randint(i + 1, n)
+
+    fwd = np.cumsum(edge[sub[:, :-1], sub[:, 1:]], axis=1)
+    bwd = np.cumsum(edge[sub[:, 1:], sub[:, :-1]], axis=1)
+    internal = (bwd[r, k - 1] - bwd[r, i - 1]) - (fwd[r, k - 1] - fwd[r, i - 1])
+
+    a, b, c = sub[r, i - 1], sub[r, i], sub[r, k]
+    d = sub[r, np.minimum(k + 1, n - 1)]
+    tail = np.where(k < n - 1, edge[b, d] - edge[c, d], 0.0)
+    delta = edge[a, c] - edge[a, b] + internal + tail
+
+    cols = np.arange(n)
+    lo, hi = i[:, None], k[:, None]
+    reverse = (cols >= lo) & (cols <= hi) & (delta < 0)[:, None]
+    sub = np.take_along_axis(sub, np.where(reverse, lo + hi - cols, cols), axis=1)
+
+    swap = np.flatnonzero(delta >= 0)
+    x = np.random.randint(1, n, len(swap))
+    y = 1 + (x - 1 + np.random.randint(1, n - 1, len(swap))) % (n - 1)
+    sub[swap, x], sub[swap, y] = sub[swap, y], sub[swap, x]
+
+    pop[rows] = sub
+    return pop
+
+def genetic_search(dist, dur, seq, weather_table):
+    """
+    GA over a preallocated pair of population buffers: each generation is
+    bred from `cur` into `nxt` in place and the two are swapped, so no route
+    arrays are allocated per generation. Routes already scored during this
+    search are looked up in `memo` instead of being re-costed.
+    """
+    n = len(dist)
+    buf = np.empty((2, POPULATION_SIZE, n), dtype=np.int32)
+    cost_buf = np.empty((2, POPULATION_SIZE))
+    cur, nxt = buf[0], buf[1]
+    costs, next_costs = cost_buf[0], cost_buf[1]
+
+    memo = OrderedDict()
+    edge = (ALPHA * dist) + (BETA * dur)
+
+    cur[:] = create_initial_population(n)
+    costs[:], _ = memoized_population_costs(cur, memo, dist, dur, seq, weather_table)
 
     best = None
     best_cost = float("inf")
+    stall = 0
+    children = POPULATION_SIZE - 2
+    hits = deque(maxlen=-(-MEMO_HIT_WINDOW // children))
 
     for _ in range(GENERATIONS):
-        population.sort(key=lambda r: cost_function(
-            r, dist_matrix, dur_matrix, forecasts, locations_data, start_time
-        ))
-        new_pop = population[:2]
+        order = np.argsort(costs, kind="stable")
+        lead = costs[order[0]]
+
+        improved = best_cost == float("inf") or best_cost - lead > CONVERGENCE_REL_TOL * best_cost
+        stall = 0 if improved else stall + 1
+        if lead < best_cost:
+            best, best_cost = cur[order[0]].copy(), lead
+        if stall >= CONVERGENCE_PATIENCE:
+            break
+
+        nxt[:2] = cur[order[:2]]
+        next_costs[:2] = costs[order[:2]]
+
+        parents = tournament_selection(costs, 2 * children).reshape(-1, 2)
+        crossover(cur[parents[:, 0]], cur[parents[:, 1]], nxt[2:])
+
+        mutate(nxt[2:], edge)
+        next_costs[2:], scored = memoized_population_costs(nxt[2:], memo, dist, dur, seq, weather_table)
+        hits.append(children - scored)
+        cur, nxt = nxt, cur
+        costs, next_costs = next_costs, costs
+
+        # A population that keeps breeding routes it has already seen has converged.
+        if len(hits) == hits.maxlen and sum(hits) > MEMO_HIT_RATE_STOP * children * hits.maxlen:
+            break
 
-        while len(new_pop) < POPULATION_SIZE:
-            p1 = tournament_selection(population, dist_matrix, dur_matrix, forecasts, locations_data, start_time)
-            p2 = tournament_selection(population, dist_matrix, dur_matrix, forecasts, locations_data, start_time)
-            new_pop.append(mutate(crossover(p1, p2)))
+    if costs.min() < best_cost:
+        best = cur[costs.argmin()].copy()
+    return best.tolist()
 
-        population = new_pop
+def solve_route(locations_data):
+    if len(locations_data) < 2:
+        return {"status": "error", "message": "Need at least 2 locations."}
+
+    dist_matrix, dur_matrix = get_distance_matrix(locations_data)
+    if dist_matrix is None:
+        return {"status": "error", "message": "Failed to fetch Matrix API."}
+
+    forecasts, (forecast_ts, forecast_waits) = get_route_weather(locations_data)
+    start_time = datetime.now()
 
-        if cost_function(population[0], dist_matrix, dur_matrix, forecasts, locations_data, start_time) < best_cost:
-            best = population[0]
-            best_cost = cost_function(best, dist_matrix, dur_matrix, forecasts, locations_data, start_time)
+    n = len(locations_data)
+    seq = np.asarray([loc.get("visit_sequence", 2) for loc in locations_data])
+    weather_table = build_wait_lookup(forecast_ts, forecast_waits, start_time.timestamp())
+
+    if n <= EXACT_SOLVER_MAX_STOPS:
+        best = held_karp(dist_matrix, dur_matrix, seq, weather_table)
+    elif n <= LOCAL_SEARCH_MAX_STOPS:
+        seed = nearest_neighbor_route(dist_matrix, dur_matrix, seq)
+        best = two_opt(seed, dist_matrix, dur_matrix, seq, weather_table)
+    else:
+        best = genetic_search(dist_matrix, dur_matrix, seq, weather_table)
 
     dist, sec, log = calculate_route_metrics(best, dist_matrix, dur_matrix, forecasts, start_time)
 
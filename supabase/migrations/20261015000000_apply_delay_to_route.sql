@@ -0,0 +1,18 @@
+-- Shift every pending ETA on a route by a delay in a single statement.
+-- Returns the number of stops whose ETA was updated.
+create or replace function apply_delay_to_route(p_route_id int, p_delay int)
+returns int
+language sql
+as $$
+    with updated as (
+        update stops
+        set eta = eta::timestamp + make_interval(mins => p_delay)
+        where route_id = p_route_id
+          and status = 'pending'
+          and eta is not null
+        returning 1
+    )
+    select count(*)::int from updated;
+$$;
+
+create index if not exists stops_route_status_idx on stops(route_id, status);
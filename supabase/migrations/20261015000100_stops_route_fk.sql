@@ -0,0 +1,18 @@
+-- PostgREST needs the stops -> active_routes relationship to embed stops
+-- in an active_routes select. Lookups by route_id are served by
+-- stops_route_status_idx (route_id is its leading column).
+do $$
+begin
+    if not exists (
+        select 1
+        from pg_constraint
+        where conrelid = 'stops'::regclass
+          and contype = 'f'
+          and confrelid = 'active_routes'::regclass
+    ) then
+        alter table stops
+            add constraint stops_route_id_fkey
+            foreign key (route_id) references active_routes(id) on delete cascade;
+    end if;
+end
+$$;
@@ -0,0 +1,26 @@
+-- Insert a route and all of its stops atomically in one call.
+-- p_stops is a JSON array of objects with stops columns (name, lat, lon,
+-- visit_sequence, status, eta); returns the new route id.
+create or replace function create_route_with_stops(
+    p_session text,
+    p_driver text,
+    p_status text,
+    p_stops jsonb
+)
+returns int
+language plpgsql
+as $$
+declare
+    rid int;
+begin
+    insert into active_routes(session_id, driver_name, status, last_updated)
+    values (p_session, p_driver, p_status, now())
+    returning id into rid;
+
+    insert into stops(route_id, name, lat, lon, visit_sequence, status, eta)
+    select rid, s.name, s.lat, s.lon, s.visit_sequence, s.status, s.eta
+    from jsonb_populate_recordset(null::stops, p_stops) as s;
+
+    return rid;
+end;
+$$;
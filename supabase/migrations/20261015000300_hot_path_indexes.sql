@@ -0,0 +1,9 @@
+-- get_session_state: session_id + status filter, newest first.
+create index if not exists active_routes_session_status_idx
+    on active_routes(session_id, status, created_at desc);
+
+-- apply_delay_to_route / stop lookups: widen the (route_id, status) index so
+-- pending-stop reads are served from the index alone.
+drop index if exists stops_route_status_idx;
+create index stops_route_status_idx
+    on stops(route_id, status) include (eta, visit_sequence);
@@ -1,34 +1,61 @@
 import os
 import requests
 import folium
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from folium.plugins import HeatMap
 from dotenv import load_dotenv
 from typing import List, Dict, Tuple, Optional
-import time
+from threading import Lock
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
 TOMTOM_BASE_URL = "https://api.tomtom.com"
 TOMTOM_TRAFFIC_FLOW_VERSION = "4"  
+# Upper bound on in-flight TomTom requests, in place of sleeping between calls.
+TOMTOM_MAX_WORKERS = 8
+
+# Keep-alive pool shared by all TomTom calls (and the fan-out workers), so
+# each request after the first skips the TCP/TLS handshake.
+TOMTOM_SESSION = requests.Session()
+TOMTOM_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+
+# Flow responses keyed by point rounded to ~100m, so overlapping probe grids
+# and repeated map renders share requests. Kept short since traffic is live.
+_flow_cache = TTLCache(maxsize=4096, ttl=120)
+_flow_lock = Lock()
+
+def location_coords(locations: List[Dict]) -> np.ndarray:
+    """(n, 2) array of [lat, lon] rows for a list of locations."""
+    return np.asarray([[loc['lat'], loc['lon']] for loc in locations], dtype=np.float64).reshape(-1, 2)
 
 def get_route_bbox(locations: List[Dict]) -> Tuple[float, float, float, float]:
     """Calculate bounding box for a list of locations."""
     if not locations:
         return (0, 0, 0, 0)
     
-    lats = [loc['lat'] for loc in locations]
-    lons = [loc['lon'] for loc in locations]
-    
+    coords = location_coords(locations)
     buffer = 0.1
-    return (
-        min(lons) - buffer,
-        min(lats) - buffer,
-        max(lons) + buffer,
-        max(lats) + buffer
-    )
+    min_lat, min_lon = coords.min(axis=0) - buffer
+    max_lat, max_lon = coords.max(axis=0) + buffer
+    return (float(min_lon), float(min_lat), float(max_lon), float(max_lat))
 
 def fetch_traffic_flow_segment(lat: float, lon: float, zoom: int = 10) -> Optional[Dict]:
     """Fetch traffic flow data for a specific point using TomTom Traffic Flow Segment Data."""    
+    lat, lon = round(lat, 3), round(lon, 3)
+    key = (lat, lon, zoom)
+    with _flow_lock:
+        cached = _flow_cache.get(key)
+    if cached is not None:
+        return cached
+
     url = f"{TOMTOM_BASE_URL}/traffic/services/{TOMTOM_TRAFFIC_FLOW_VERSION}/flowSegmentData/relative/{zoom}/json"
     
     params = {
@@ -38,9 +65,12 @@ def fetch_traffic_flow_segment(lat: float, lon: float, zoom: int = 10) -> Option
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = TOMTOM_SESSION.get(url, params=params, timeout=10)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
+        with _flow_lock:
+            _flow_cache[key] = data
+        return data
     except requests.exceptions.RequestException as e:
         print(f"[Traffic] TomTom API error for point ({lat}, {lon}): {e}")
         return None
@@ -58,7 +88,7 @@ def fetch_traffic_incidents(bbox: Tuple[float, float, float, float]) -> Optional
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10) 
+        response = TOMTOM_SESSION.get(url, params=params, timeout=10) 
         # if response.status_code == 400:
         #     print(f"TomTom Detail: {response.text}")
         response.raise_for_status()
@@ -71,25 +101,23 @@ def fetch_incidents_for_route_stops(locations: List[Dict], buffer: float = 0.4)
     """Fetches incidents specifically around each stop on the route."""
     all_combined_incidents = []
     seen_ids = set()
-    for loc in locations:
-        lat, lon = loc['lat'], loc['lon']
-        stop_bbox = (
-            lon - buffer, 
-            lat - buffer, 
-            lon + buffer, 
-            lat + buffer  
-        )
-        
-        data = fetch_traffic_incidents(stop_bbox)
-        
+    coords = location_coords(locations)
+    # (min_lon, min_lat, max_lon, max_lat) per stop
+    stop_bboxes = [
+        tuple(row) for row in
+        (coords[:, [1, 0, 1, 0]] + np.array([-buffer, -buffer, buffer, buffer])).tolist()
+    ]
+
+    with ThreadPoolExecutor(max_workers=TOMTOM_MAX_WORKERS) as pool:
+        results = list(pool.map(fetch_traffic_incidents, stop_bboxes))
+
+    for data in results:
         if data and 'incidents' in data:
             for incident in data['incidents']:
                 incident_id = incident.get('properties', {}).get('id')
                 if incident_id not in seen_ids:
                     all_combined_incidents.append(incident)
                     seen_ids.add(incident_id)
-        
-        time.sleep(0.2)
 
     return {"incidents": all_combined_incidents}
 
@@ -146,9 +174,14 @@ def collect_traffic_data_for_route(locations: List[Dict]) -> Tuple[List, Dict]:
     segment_analyses = []
     total_delays = 0
     severe_segments = 0    
-    for i, location in enumerate(locations):
-        flow_data = fetch_traffic_flow_segment(location['lat'], location['lon'])
-        
+    with ThreadPoolExecutor(max_workers=TOMTOM_MAX_WORKERS) as pool:
+        flows = list(pool.map(
+            fetch_traffic_flow_segment,
+            [loc['lat'] for loc in locations],
+            [loc['lon'] for loc in locations]
+        ))
+
+    for location, flow_data in zip(locations, flows):
         if flow_data:
             analysis = analyze_traffic_flow(flow_data)
             intensity = 1 - analysis['speed_ratio']
@@ -169,8 +202,6 @@ def collect_traffic_data_for_route(locations: List[Dict]) -> Tuple[List, Dict]:
                 "current_speed": analysis['current_speed'],
                 "delay_factor": round(analysis['delay_factor'], 2)
             })
-        
-        time.sleep(0.2)
     
     avg_delay = total_delays / len(locations) if locations else 0
     
@@ -191,10 +222,16 @@ def collect_traffic_data_for_route(locations: List[Dict]) -> Tuple[List, Dict]:
     
     return heatmap_data, analysis_summary
 
-def draw_local_road_traffic(m, center_lat, center_lon, radius_km=1.2):
-    """Draws traffic road segments around a point using TomTom Flow API"""
-    steps = 4
+def draw_local_road_traffic(m, center_lat, center_lon, radius_km=1.2, visited=None, seen_segments=None):
+    """
+    Draws traffic road segments around a point using TomTom Flow API.
+    Pass the same visited/seen_segments sets for every stop on a map so
+    overlapping grids are neither re-requested nor drawn twice.
+    """
+    steps = 2
     offset = radius_km / 111.0
+    visited = set() if visited is None else visited
+    seen_segments = set() if seen_segments is None else seen_segments
 
     lat_points = [
         center_lat - offset + i * (2 * offset / steps)
@@ -205,34 +242,41 @@ def draw_local_road_traffic(m, center_lat, center_lon, radius_km=1.2):
         for i in range(steps + 1)
     ]
 
-    seen_segments = set()
-
+    grid = []
     for lat in lat_points:
         for lon in lon_points:
-            data = fetch_traffic_flow_segment(lat, lon)
-            if not data:
-                continue
+            cell = (round(lat, 2), round(lon, 2))
+            if cell not in visited:
+                visited.add(cell)
+                grid.append((lat, lon))
+    if not grid:
+        return
 
-            analysis = analyze_traffic_flow(data)
-            coords = analysis["coordinates"]
-            if len(coords) < 2:
-                continue
+    with ThreadPoolExecutor(max_workers=TOMTOM_MAX_WORKERS) as pool:
+        results = list(pool.map(fetch_traffic_flow_segment, *zip(*grid)))
 
-            segment_id = str(coords[0])
-            if segment_id in seen_segments:
-                continue
+    for data in results:
+        if not data:
+            continue
 
-            folium.PolyLine(
-                locations=coords,
-                color=analysis["color"],
-                weight=6,
-                opacity=0.9,
-                tooltip=f"{analysis['current_speed']} km/h"
-            ).add_to(m)
+        analysis = analyze_traffic_flow(data)
+        coords = analysis["coordinates"]
+        if len(coords) < 2:
+            continue
 
-            seen_segments.add(segment_id)
+        segment_id = str(coords[0])
+        if segment_id in seen_segments:
+            continue
 
-            time.sleep(0.2)
+        folium.PolyLine(
+            locations=coords,
+            color=analysis["color"],
+            weight=6,
+            opacity=0.9,
+            tooltip=f"{analysis['current_speed']} km/h"
+        ).add_to(m)
+
+        seen_segments.add(segment_id)
 
 def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Dict]] = None, filename: str = "traffic_map.html", fast_mode: bool = False) -> Dict:
     """Generate an interactive HTML map with traffic conditions."""
@@ -243,8 +287,7 @@ def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Di
             "details": "No locations provided"
         }
         
-    avg_lat = sum(loc['lat'] for loc in locations) / len(locations)
-    avg_lon = sum(loc['lon'] for loc in locations) / len(locations)
+    avg_lat, avg_lon = location_coords(locations).mean(axis=0).tolist()
     
     heatmap_data, analysis_summary = collect_traffic_data_for_route(locations)
     incidents_data = fetch_incidents_for_route_stops(locations, buffer=0.4)    
@@ -256,8 +299,9 @@ def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Di
     )
     
     if not fast_mode: 
+        visited, seen_segments = set(), set()
         for loc in locations:
-            draw_local_road_traffic(m, loc["lat"], loc["lon"], radius_km=1.2)
+            draw_local_road_traffic(m, loc["lat"], loc["lon"], radius_km=1.2, visited=visited, seen_segments=seen_segments)
     
     if heatmap_data:
         HeatMap(
@@ -275,6 +319,7 @@ def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Di
             }
         ).add_to(m)
     
+    stops_layer = folium.FeatureGroup(name='Stops')
     for i, loc in enumerate(locations):
         if i < len(analysis_summary['segment_details']):
             segment = analysis_summary['segment_details'][i]
@@ -312,7 +357,8 @@ def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Di
                 prefix='fa'
             ),
             tooltip=f"{i+1}. {loc['name']}"
-        ).add_to(m)
+        ).add_to(stops_layer)
+    stops_layer.add_to(m)
     
     if route_sequence:
         points = [[loc['lat'], loc['lon']] for loc in route_sequence]
@@ -327,6 +373,8 @@ def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Di
     
     if incidents_data and 'incidents' in incidents_data:
         incident_count = 0
+        # Incidents share one GeoJSON layer per icon style instead of a Marker each.
+        incident_features = {}
         for incident in incidents_data['incidents']:
             try:
                 props = incident.get('properties', {})
@@ -352,17 +400,26 @@ def generate_traffic_map(locations: List[Dict], route_sequence: Optional[List[Di
                         events = props.get('events', [])
                         description = events[0].get('description', 'Traffic incident') if events else 'Traffic incident'
                         
-                        folium.Marker(
-                            location=[incident_lat, incident_lon],
-                            popup=f"<b>INCIDENT</b><br>{description}<br>Delay: {magnitude} min",
-                            icon=folium.Icon(color=color, icon=icon, prefix='fa'),
-                            tooltip="Traffic Incident"
-                        ).add_to(m)
+                        incident_features.setdefault((color, icon), []).append({
+                            "type": "Feature",
+                            "geometry": {"type": "Point", "coordinates": [incident_lon, incident_lat]},
+                            "properties": {"popup": f"<b>INCIDENT</b><br>{description}<br>Delay: {magnitude} min"}
+                        })
                         
                         incident_count += 1
             except Exception as e:
                 print(f"[Traffic] Error processing incident: {e}")
                 continue        
+
+        incidents_layer = folium.FeatureGroup(name='Incidents')
+        for (color, icon), features in incident_features.items():
+            folium.GeoJson(
+                {"type": "FeatureCollection", "features": features},
+                marker=folium.Marker(icon=folium.Icon(color=color, icon=icon, prefix='fa')),
+                popup=folium.GeoJsonPopup(fields=["popup"], labels=False),
+                tooltip="Traffic Incident"
+            ).add_to(incidents_layer)
+        incidents_layer.add_to(m)
     
     legend_html = '''
     <div style="position: fixed; 